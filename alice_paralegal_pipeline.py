@@ -4,113 +4,152 @@ author: Don Strickland
 version: 1.0
 license: MIT
 description: Fully local pipeline - Tesseract OCR reads images, deepseek-r1:8b does legal reasoning
-requirements: pytesseract, Pillow
+requirements: pytesseract, Pillow, orjson
 """
 
-import io
-import base64
-import json
-import requests
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import List, Generator
-from pydantic import BaseModel, Field
+from pydantic import Field
 
-try:
-    import pytesseract
-    from PIL import Image
-    TESSERACT_AVAILABLE = True
-except ImportError:
-    TESSERACT_AVAILABLE = False
+# Shared helpers live next to this file - appended so nothing here shadows an installed package
+_PIPELINES_DIR = os.path.dirname(os.path.abspath(__file__))
+if _PIPELINES_DIR not in sys.path:
+    sys.path.append(_PIPELINES_DIR)
+
+from pipeline_common import OllamaValves, build_options, get_client, iter_images, warm_model
+from pipeline_common.ocr import OCR_WORKERS, TESSEROCR_AVAILABLE, ocr_image, submit_batch
+
+# OCR results keyed on a hash of the image - a re-asked screenshot skips Tesseract
+_OCR_CACHE_SIZE = 256
+_OCR_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+_OCR_CACHE_LOCK = threading.Lock()
+
+
+def _ocr_cache_key(image_b64: str) -> bytes:
+    """Hash base64 image data for the OCR cache - no decode needed."""
+    return hashlib.blake2b(image_b64.encode(), digest_size=16).digest()
+
+
+def _ocr_cache_get(key: bytes):
+    """Return cached OCR text for key, or None on a miss."""
+    with _OCR_CACHE_LOCK:
+        text = _OCR_CACHE.get(key)
+        if text is not None:
+            _OCR_CACHE.move_to_end(key)
+        return text
+
+
+def _ocr_cache_put(key: bytes, text: str) -> None:
+    """Store OCR text, evicting the least recently used entry when full."""
+    with _OCR_CACHE_LOCK:
+        _OCR_CACHE[key] = text
+        _OCR_CACHE.move_to_end(key)
+        while len(_OCR_CACHE) > _OCR_CACHE_SIZE:
+            _OCR_CACHE.popitem(last=False)
+
+
+# Prompt templates are constant - only the per-request text is filled in
+_IMAGE_PROMPT = """You are a legal reasoning assistant for Texas bar exam preparation.
+
+Here is the question extracted from the image:
+{ocr}
+
+User asks: {question}
+
+Provide thorough legal analysis:
+1. Identify the legal issue(s) being tested
+2. State the applicable rule(s) of law
+3. Apply the rule to these specific facts
+4. Analyze each answer choice - explain why it is correct or incorrect
+5. State the best answer with confidence"""
+
+_TEXT_PROMPT = """You are a legal reasoning assistant for Texas bar exam preparation.
+
+Question: {question}
+
+Provide thorough legal analysis:
+1. Identify the legal issue(s)
+2. State the applicable rule(s) of law  
+3. Apply the rule to the facts
+4. Reach a conclusion"""
 
 
 class Pipeline:
     """Alice Paralegal - fully local vision + reasoning pipeline."""
 
-    class Valves(BaseModel):
-        OLLAMA_HOST: str = Field(
-            default="http://host.docker.internal:11434",
-            description="Ollama API endpoint"
-        )
+    class Valves(OllamaValves):
         REASONING_MODEL: str = Field(
             default="deepseek-r1:8b",
             description="Local model for legal reasoning"
         )
-        TEMPERATURE: float = Field(
-            default=0.3,
-            description="Lower temperature for focused legal analysis"
-        )
 
     def __init__(self):
         self.name = "Alice Paralegal"
         self.valves = self.Valves()
 
-    def _extract_images(self, messages: List[dict]) -> tuple:
-        """Extract images and text from messages. Returns (images_bytes_list, text_content)."""
-        images = []
-        text_parts = []
-        
-        for msg in messages:
-            content = msg.get("content", "")
-            
-            if isinstance(content, str):
-                text_parts.append(content)
-                continue
-            
-            if isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict):
-                        if item.get("type") == "text":
-                            text_parts.append(item.get("text", ""))
-                        elif item.get("type") == "image_url":
-                            url = item.get("image_url", {}).get("url", "")
-                            if url.startswith("data:image"):
-                                try:
-                                    base64_data = url.split(",", 1)[1]
-                                    image_bytes = base64.b64decode(base64_data)
-                                    images.append(image_bytes)
-                                except (IndexError, ValueError):
-                                    pass
-                    elif isinstance(item, str):
-                        text_parts.append(item)
-        
-        return (images, " ".join(text_parts))
+    async def on_startup(self):
+        warm_model(self.valves, self.valves.REASONING_MODEL)
 
-    def _ocr_image(self, image_bytes: bytes) -> str:
+    async def on_valves_updated(self):
+        warm_model(self.valves, self.valves.REASONING_MODEL)
+
+    def _extract_images(self, messages: List[dict]) -> List[str]:
+        """Extract the base64 images in messages. Decoding is left to the OCR workers."""
+        return list(iter_images(messages))
+
+    def _ocr_image(self, image_b64: str) -> str:
         """Use Tesseract to extract text from image."""
-        if not TESSERACT_AVAILABLE:
-            return "Error: pytesseract not installed"
+        key = _ocr_cache_key(image_b64)
+        text = _ocr_cache_get(key)
+        if text is None:
+            ok, text = ocr_image(image_b64)
+            if ok:
+                _ocr_cache_put(key, text)
+        return text
+
+    def _ocr_image_batch(self, images: List[str]) -> Generator[str, None, None]:
+        """OCR many images on the pool. Yields text in page order as each page finishes."""
+        keys = [_ocr_cache_key(image_b64) for image_b64 in images]
+        cached = [_ocr_cache_get(key) for key in keys]
+        misses = [i for i, text in enumerate(cached) if text is None]
         
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            text = pytesseract.image_to_string(image)
-            return text.strip()
-        except Exception as e:
-            return f"Error reading image: {str(e)}"
+        # tesserocr keeps its engine loaded, so send pages one at a time and stream
+        # them back; the pytesseract list file needs one chunk per worker to pay off
+        size = 1 if TESSEROCR_AVAILABLE else max(1, -(-len(misses) // OCR_WORKERS))
+        chunks = iter([
+            (indices, submit_batch([images[i] for i in indices]))
+            for indices in (misses[start:start + size] for start in range(0, len(misses), size))
+        ])
+        
+        # Misses are filled in by page index as their chunk completes
+        for i, key in enumerate(keys):
+            if cached[i] is None:
+                indices, future = next(chunks)
+                try:
+                    chunk_results = future.result()
+                except Exception as e:
+                    chunk_results = [(False, f"Error reading image: {str(e)}")] * len(indices)
+                # Only real text is cached, so a failed page is retried next time
+                for j, (ok, chunk_text) in zip(indices, chunk_results):
+                    cached[j] = chunk_text
+                    if ok:
+                        _ocr_cache_put(keys[j], chunk_text)
+            yield cached[i]
 
     def _call_ollama_stream(self, prompt: str) -> Generator[str, None, None]:
         """Call Ollama API for local reasoning with streaming."""
         
         try:
-            response = requests.post(
-                f"{self.valves.OLLAMA_HOST}/api/generate",
-                json={
-                    "model": self.valves.REASONING_MODEL,
-                    "prompt": prompt,
-                    "stream": True,
-                    "options": {"temperature": self.valves.TEMPERATURE}
-                },
-                stream=True,
-                timeout=300
+            yield from get_client(self.valves.OLLAMA_HOST).stream(
+                self.valves.REASONING_MODEL,
+                prompt,
+                options=build_options(self.valves),
+                keep_alive=self.valves.KEEP_ALIVE
             )
-            response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        data = json.loads(line)
-                        if "response" in data:
-                            yield data["response"]
-                    except json.JSONDecodeError:
-                        continue
                         
         except Exception as e:
             yield f"Error calling {self.valves.REASONING_MODEL}: {str(e)}"
@@ -124,50 +163,36 @@ class Pipeline:
     ) -> Generator[str, None, None]:
         """Process input - use Tesseract for images, local model for reasoning."""
         
-        images, text_content = self._extract_images(messages)
+        images = self._extract_images(messages)
         
         if images:
             yield "👁️ *Alice Paralegal reading image with Tesseract OCR...*\n\n"
             
-            # OCR all images
-            all_text = []
-            for i, img_bytes in enumerate(images):
-                ocr_text = self._ocr_image(img_bytes)
-                all_text.append(ocr_text)
+            if len(images) > 1:
+                # Show each page as soon as it is read instead of waiting for all of them
+                all_text = [None] * len(images)
+                for i, ocr_text in enumerate(self._ocr_image_batch(images)):
+                    all_text[i] = ocr_text
+                    yield f"**Page {i + 1}:**\n```\n{ocr_text}\n```\n\n"
+                combined_ocr = "\n\n".join(all_text)
+                yield "---\n\n"
+            else:
+                combined_ocr = self._ocr_image(images[0])
+                yield f"**Extracted Text:**\n```\n{combined_ocr}\n```\n\n---\n\n"
             
-            combined_ocr = "\n\n".join(all_text)
-            
-            yield f"**Extracted Text:**\n```\n{combined_ocr}\n```\n\n---\n\n"
             yield "⚖️ *Analyzing with deepseek-r1:8b...*\n\n"
             
             # Send to reasoning model
-            reasoning_prompt = f"""You are a legal reasoning assistant for Texas bar exam preparation.
-
-Here is the question extracted from the image:
-{combined_ocr}
-
-User asks: {user_message if user_message else "What is the correct answer?"}
-
-Provide thorough legal analysis:
-1. Identify the legal issue(s) being tested
-2. State the applicable rule(s) of law
-3. Apply the rule to these specific facts
-4. Analyze each answer choice - explain why it is correct or incorrect
-5. State the best answer with confidence"""
+            reasoning_prompt = _IMAGE_PROMPT.format(
+                ocr=combined_ocr,
+                question=user_message if user_message else "What is the correct answer?"
+            )
 
             for chunk in self._call_ollama_stream(reasoning_prompt):
                 yield chunk
         else:
             # No images - direct legal reasoning
-            reasoning_prompt = f"""You are a legal reasoning assistant for Texas bar exam preparation.
-
-Question: {user_message}
-
-Provide thorough legal analysis:
-1. Identify the legal issue(s)
-2. State the applicable rule(s) of law  
-3. Apply the rule to the facts
-4. Reach a conclusion"""
+            reasoning_prompt = _TEXT_PROMPT.format(question=user_message)
 
             for chunk in self._call_ollama_stream(reasoning_prompt):
                 yield chunk
@@ -4,24 +4,58 @@ author: Don Strickland
 version: 1.0
 license: MIT
 description: Two-stage pipeline - llava:13b interprets images, deepseek-r1:8b does legal reasoning
-requirements: requests
+requirements: requests, orjson
 """
 
-import requests
-import base64
-import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Generator
-from pydantic import BaseModel, Field
+from pydantic import Field
+
+# Shared helpers live next to this file - appended so nothing here shadows an installed package
+_PIPELINES_DIR = os.path.dirname(os.path.abspath(__file__))
+if _PIPELINES_DIR not in sys.path:
+    sys.path.append(_PIPELINES_DIR)
+
+from pipeline_common import OllamaValves, build_options, extract_images, get_client, warm_model
+
+# Prompt templates are constant - only the per-request text is filled in
+_VISION_PROMPT = """Describe this image in detail. If it contains text (like a legal question, 
+exam problem, or document), transcribe ALL the text exactly as written. Include any multiple choice 
+options if present.
+
+User's question: {question}"""
+
+_IMAGE_PROMPT = """You are a legal reasoning assistant helping with Texas bar exam preparation.
+
+Based on this image content:
+{description}
+
+User's question: {question}
+
+Provide thorough legal analysis. If this is a multiple choice question:
+1. Identify the legal issue(s)
+2. State the applicable rule(s) of law
+3. Apply the rule to the facts
+4. Explain why each answer choice is correct or incorrect
+5. State the best answer with confidence"""
+
+_TEXT_PROMPT = """You are a legal reasoning assistant helping with Texas bar exam preparation.
+
+Question: {question}
+
+Provide thorough legal analysis. If this is a legal question:
+1. Identify the legal issue(s)
+2. State the applicable rule(s) of law  
+3. Apply the rule to the facts
+4. Reach a conclusion"""
 
 
 class Pipeline:
     """Legal Vision pipeline - uses llava for images, deepseek-r1 for reasoning."""
 
-    class Valves(BaseModel):
-        OLLAMA_HOST: str = Field(
-            default="http://host.docker.internal:11434",
-            description="Ollama API endpoint"
-        )
+    class Valves(OllamaValves):
         VISION_MODEL: str = Field(
             default="llava:13b",
             description="Model for image interpretation"
@@ -30,84 +64,42 @@ class Pipeline:
             default="deepseek-r1:8b",
             description="Model for legal reasoning"
         )
-        TEMPERATURE: float = Field(
-            default=0.3,
-            description="Lower temperature for more focused legal analysis"
-        )
 
     def __init__(self):
         self.name = "Legal Vision (llava + deepseek-r1)"
         self.valves = self.Valves()
 
-    def _has_images(self, messages: List[dict]) -> tuple:
-        """Check if any message contains images. Returns (has_image, images_list, text_content)."""
-        images = []
-        text_parts = []
-        
-        for msg in messages:
-            content = msg.get("content", "")
-            
-            # Handle string content
-            if isinstance(content, str):
-                text_parts.append(content)
-                continue
-            
-            # Handle list content (may contain images)
-            if isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict):
-                        if item.get("type") == "text":
-                            text_parts.append(item.get("text", ""))
-                        elif item.get("type") == "image_url":
-                            url = item.get("image_url", {}).get("url", "")
-                            if url.startswith("data:image"):
-                                # Extract base64 data
-                                try:
-                                    base64_data = url.split(",")[1]
-                                    images.append(base64_data)
-                                except IndexError:
-                                    pass
-                    elif isinstance(item, str):
-                        text_parts.append(item)
-        
-        return (len(images) > 0, images, " ".join(text_parts))
+    async def on_startup(self):
+        warm_model(self.valves, self.valves.REASONING_MODEL)
+
+    async def on_valves_updated(self):
+        warm_model(self.valves, self.valves.REASONING_MODEL)
+
+    def _extract_images(self, messages: List[dict]) -> tuple:
+        """Extract images and text from messages. Returns (base64_images_list, text_content)."""
+        return extract_images(messages)
 
     def _call_ollama(self, model: str, prompt: str, images: List[str] = None, stream: bool = True) -> Generator[str, None, None]:
         """Call Ollama API with optional images."""
-        
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": stream,
-            "options": {
-                "temperature": self.valves.TEMPERATURE
-            }
-        }
-        
-        if images:
-            payload["images"] = images
+        client = get_client(self.valves.OLLAMA_HOST)
         
         try:
-            response = requests.post(
-                f"{self.valves.OLLAMA_HOST}/api/generate",
-                json=payload,
-                stream=stream,
-                timeout=300
-            )
-            response.raise_for_status()
-            
             if stream:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if "response" in data:
-                                yield data["response"]
-                        except json.JSONDecodeError:
-                            continue
+                yield from client.stream(
+                    model,
+                    prompt,
+                    images,
+                    options=build_options(self.valves),
+                    keep_alive=self.valves.KEEP_ALIVE
+                )
             else:
-                data = response.json()
-                yield data.get("response", "")
+                yield client.generate(
+                    model,
+                    prompt,
+                    images,
+                    options=build_options(self.valves),
+                    keep_alive=self.valves.KEEP_ALIVE
+                )
                 
         except Exception as e:
             yield f"Error calling {model}: {str(e)}"
@@ -115,27 +107,14 @@ class Pipeline:
     def _call_ollama_sync(self, model: str, prompt: str, images: List[str] = None) -> str:
         """Call Ollama API synchronously (non-streaming) for image interpretation."""
         
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": self.valves.TEMPERATURE
-            }
-        }
-        
-        if images:
-            payload["images"] = images
-        
         try:
-            response = requests.post(
-                f"{self.valves.OLLAMA_HOST}/api/generate",
-                json=payload,
-                timeout=300
+            return get_client(self.valves.OLLAMA_HOST).generate(
+                model,
+                prompt,
+                images,
+                options=build_options(self.valves),
+                keep_alive=self.valves.KEEP_ALIVE
             )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("response", "")
                 
         except Exception as e:
             return f"Error calling {model}: {str(e)}"
@@ -150,55 +129,42 @@ class Pipeline:
         """Process input - route through llava if images present, then deepseek-r1 for reasoning."""
         
         # Check for images in the conversation
-        has_images, images, text_content = self._has_images(messages)
+        images, text_content = self._extract_images(messages)
         
-        if has_images:
+        if images:
             # Stage 1: Use llava to interpret the image(s)
             yield "🔍 *Analyzing image with llava:13b...*\n\n"
             
-            vision_prompt = f"""Describe this image in detail. If it contains text (like a legal question, 
-exam problem, or document), transcribe ALL the text exactly as written. Include any multiple choice 
-options if present.
-
-User's question: {user_message if user_message else text_content}"""
-            
-            image_description = self._call_ollama_sync(
-                self.valves.VISION_MODEL,
-                vision_prompt,
-                images
+            vision_prompt = _VISION_PROMPT.format(
+                question=user_message if user_message else text_content
             )
             
+            # Describe each image concurrently - the calls are HTTP-bound
+            with ThreadPoolExecutor(max_workers=min(len(images), 4)) as executor:
+                descriptions = list(executor.map(
+                    lambda image: self._call_ollama_sync(
+                        self.valves.VISION_MODEL,
+                        vision_prompt,
+                        [image]
+                    ),
+                    images
+                ))
+            image_description = "\n\n".join(descriptions)
+            
             yield f"**Image Analysis:**\n{image_description}\n\n---\n\n"
             yield "⚖️ *Processing with deepseek-r1:8b for legal reasoning...*\n\n"
             
             # Stage 2: Use deepseek-r1 for legal reasoning
-            reasoning_prompt = f"""You are a legal reasoning assistant helping with Texas bar exam preparation.
-
-Based on this image content:
-{image_description}
-
-User's question: {user_message if user_message else "Analyze this and provide legal reasoning."}
-
-Provide thorough legal analysis. If this is a multiple choice question:
-1. Identify the legal issue(s)
-2. State the applicable rule(s) of law
-3. Apply the rule to the facts
-4. Explain why each answer choice is correct or incorrect
-5. State the best answer with confidence"""
+            reasoning_prompt = _IMAGE_PROMPT.format(
+                description=image_description,
+                question=user_message if user_message else "Analyze this and provide legal reasoning."
+            )
 
             for chunk in self._call_ollama(self.valves.REASONING_MODEL, reasoning_prompt):
                 yield chunk
         else:
             # No images - direct to deepseek-r1 for text-based legal reasoning
-            reasoning_prompt = f"""You are a legal reasoning assistant helping with Texas bar exam preparation.
-
-Question: {user_message}
-
-Provide thorough legal analysis. If this is a legal question:
-1. Identify the legal issue(s)
-2. State the applicable rule(s) of law  
-3. Apply the rule to the facts
-4. Reach a conclusion"""
+            reasoning_prompt = _TEXT_PROMPT.format(question=user_message)
 
             for chunk in self._call_ollama(self.valves.REASONING_MODEL, reasoning_prompt):
                 yield chunk
@@ -0,0 +1,19 @@
+"""
+Shared helpers for the pipelines in this directory.
+
+Kept in a package (not a top-level .py file) so the pipelines server does not
+try to load it as a pipeline of its own.
+"""
+
+from .messages import extract_images, iter_images
+from .ollama_client import OllamaClient, OllamaValves, build_options, get_client, warm_model
+
+__all__ = [
+    "extract_images",
+    "iter_images",
+    "OllamaClient",
+    "OllamaValves",
+    "build_options",
+    "get_client",
+    "warm_model",
+]
@@ -0,0 +1,50 @@
+"""Read text and images out of Open WebUI chat messages."""
+
+from typing import Iterator, List, Tuple
+
+
+def _iter_parts(messages: List[dict]) -> Iterator[Tuple[str, str]]:
+    """Yield ("text", text) and ("image", base64_data) for each message part, in order."""
+    for msg in messages:
+        content = msg.get("content", "")
+        
+        # Handle string content
+        if isinstance(content, str):
+            yield ("text", content)
+            continue
+        
+        # Handle list content (may contain images)
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict):
+                    if item.get("type") == "text":
+                        yield ("text", item.get("text", ""))
+                    elif item.get("type") == "image_url":
+                        url = item.get("image_url", {}).get("url", "")
+                        if url.startswith("data:image"):
+                            # Pass the base64 body through as-is; the length check
+                            # drops truncated attachments without decoding them
+                            base64_data = url.partition(",")[2]
+                            if base64_data and len(base64_data) % 4 == 0:
+                                yield ("image", base64_data)
+                elif isinstance(item, str):
+                    yield ("text", item)
+
+
+def iter_images(messages: List[dict]) -> Iterator[str]:
+    """Yield the base64 data of every image in messages, skipping the text."""
+    return (data for kind, data in _iter_parts(messages) if kind == "image")
+
+
+def extract_images(messages: List[dict]) -> Tuple[List[str], str]:
+    """Extract images and text from messages. Returns (base64_images_list, text_content)."""
+    images = []
+    text_parts = []
+    
+    for kind, data in _iter_parts(messages):
+        if kind == "image":
+            images.append(data)
+        else:
+            text_parts.append(data)
+    
+    return (images, " ".join(text_parts))
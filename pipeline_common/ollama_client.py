@@ -0,0 +1,196 @@
+"""
+Shared Ollama client.
+
+Every pipeline that talks to the same Ollama host shares one pooled session,
+so loading several pipelines does not multiply connections, and each model is
+warmed up only once.
+"""
+
+import json
+import threading
+from typing import Iterator, List, Optional
+
+import requests
+from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_HEADERS = {"Connection": "keep-alive", "Accept-Encoding": "gzip"}
+
+# Sized for the busiest turn: legal_vision's concurrent vision calls plus a
+# reasoning stream from each pipeline
+_POOL_SIZE = 8
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+class OllamaValves(BaseModel):
+    """Valves shared by every pipeline that calls Ollama. Pipelines add their model fields."""
+
+    OLLAMA_HOST: str = Field(
+        default="http://host.docker.internal:11434",
+        description="Ollama API endpoint"
+    )
+    TEMPERATURE: float = Field(
+        default=0.3,
+        description="Lower temperature for more focused legal analysis"
+    )
+    NUM_CTX: int = Field(
+        default=4096,
+        description="Context window - exam prompts fit in 4096, and a smaller window means a smaller KV cache"
+    )
+    NUM_BATCH: int = Field(
+        default=512,
+        description="Prompt tokens processed per batch during prefill"
+    )
+    NUM_THREAD: int = Field(
+        default=0,
+        description="CPU threads for Ollama to use (0 = Ollama's default)"
+    )
+    KEEP_ALIVE: str = Field(
+        default="30m",
+        description="How long Ollama keeps models loaded after a request"
+    )
+
+
+def build_options(valves: OllamaValves) -> dict:
+    """Build the Ollama model options from the valves."""
+    options = {
+        "temperature": valves.TEMPERATURE,
+        "num_ctx": valves.NUM_CTX,
+        "num_batch": valves.NUM_BATCH
+    }
+    if valves.NUM_THREAD:
+        options["num_thread"] = valves.NUM_THREAD
+    return options
+
+
+def _iter_ndjson(response: requests.Response) -> Iterator[dict]:
+    """Yield each object of a streamed NDJSON response as soon as its line is complete."""
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is not None:
+        # Returns whatever bytes have arrived instead of waiting for a full buffer
+        chunks = iter(lambda: read1(65536, decode_content=True), b"")
+    else:
+        chunks = response.iter_content(chunk_size=None)
+    
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        start = 0
+        end = buffer.find(b"\n")
+        while end != -1:
+            line = buffer[start:end]
+            start = end + 1
+            if line.strip():
+                try:
+                    yield _json_loads(line)
+                except json.JSONDecodeError:
+                    pass
+            end = buffer.find(b"\n", start)
+        # Keep the trailing partial line for the next chunk
+        del buffer[:start]
+    
+    if buffer.strip():
+        try:
+            yield _json_loads(buffer)
+        except json.JSONDecodeError:
+            pass
+
+
+class OllamaClient:
+    """Pooled connection to one Ollama host."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_POOL_SIZE, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        
+        self._warmed = set()
+        self._warmed_lock = threading.Lock()
+
+    def _post(self, model: str, prompt: str, stream: bool, images: Optional[List[str]],
+              options: Optional[dict], keep_alive: Optional[str]) -> requests.Response:
+        """POST a generate request and raise on an HTTP error status."""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        if options:
+            payload["options"] = options
+        if images:
+            payload["images"] = images
+        
+        response = self._session.post(
+            f"{self.host}/api/generate",
+            headers=_HEADERS,
+            json=payload,
+            stream=stream,
+            timeout=300
+        )
+        response.raise_for_status()
+        return response
+
+    def warmup(self, model: str, keep_alive: Optional[str] = None, options: Optional[dict] = None) -> None:
+        """Load model in the background so the first request skips the cold start.
+
+        Call from a pipeline's on_startup and on_valves_updated - the server
+        applies saved valves after __init__. Runs once per model and options,
+        since Ollama reloads a model whose num_ctx changes.
+        """
+        key = (model, keep_alive, tuple(sorted((options or {}).items())))
+        with self._warmed_lock:
+            if key in self._warmed:
+                return
+            self._warmed.add(key)
+        
+        def load():
+            try:
+                self._post(model, "", False, None, options, keep_alive)
+            except Exception:
+                # Let the next warmup call try again
+                with self._warmed_lock:
+                    self._warmed.discard(key)
+        
+        threading.Thread(target=load, daemon=True).start()
+
+    def stream(self, model: str, prompt: str, images: Optional[List[str]] = None,
+               options: Optional[dict] = None, keep_alive: Optional[str] = None) -> Iterator[str]:
+        """Stream the response text from model as it is generated."""
+        response = self._post(model, prompt, True, images, options, keep_alive)
+        with response:
+            for data in _iter_ndjson(response):
+                if "response" in data:
+                    yield data["response"]
+
+    def generate(self, model: str, prompt: str, images: Optional[List[str]] = None,
+                 options: Optional[dict] = None, keep_alive: Optional[str] = None) -> str:
+        """Return the full response text from model."""
+        response = self._post(model, prompt, False, images, options, keep_alive)
+        return _json_loads(response.content).get("response", "")
+
+
+def get_client(host: str) -> OllamaClient:
+    """Return the shared client for host, creating it on first use."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(host)
+        if client is None:
+            client = OllamaClient(host)
+            _CLIENTS[host] = client
+        return client
+
+
+def warm_model(valves: OllamaValves, model: str) -> None:
+    """Warm up model on the host and with the options the valves select."""
+    get_client(valves.OLLAMA_HOST).warmup(model, valves.KEEP_ALIVE, build_options(valves))